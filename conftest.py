@@ -14,7 +14,7 @@ collect_ignore = ["setup.py"]
 try:
     import numba  # noqa: F401
 except ModuleNotFoundError:
-    collect_ignore.append("speechbrain/nnet/loss/transducer_loss.py")
+    collect_ignore.append("speechbrain/nnet/loss/_transducer_kernels.py")
 try:
     import kenlm  # noqa: F401
 except ModuleNotFoundError:
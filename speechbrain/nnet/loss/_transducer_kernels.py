@@ -0,0 +1,541 @@
+"""
+Numba CUDA kernels of the transducer loss, imported on the first use of
+the numba backend of speechbrain.nnet.loss.transducer_loss. The compiled
+kernels are cached on disk by numba (see NUMBA_CACHE_DIR), so that only the
+first process pays the compilation.
+
+Authors
+ * Abdelwahab Heba 2020
+ * Titouan Parcollet 2023
+"""
+
+import logging
+import math
+import warnings
+
+from numba import cuda, float32
+
+from speechbrain.utils.logger import get_logger
+
+NUMBA_VERBOSE = 0
+# bounds the label axis of log_probs, the recurrences keep four rows of
+# MAX_LABEL_LENGTH + 1 float32 in shared memory, 16 KB at most
+MAX_LABEL_LENGTH = 1024
+# the constants below are compiled into the cached kernels, they are
+# defined here so that editing them invalidates the numba cache
+WARP_SIZE = 32
+FULL_MASK = 0xFFFFFFFF
+
+logger = get_logger(__name__)
+
+# finite stand-in for log(0), sums of a few of them stay finite and never
+# produce inf - inf
+LOG_ZERO = -1e30
+
+# Numba is extra verbose and this may lead to log.txt file of multiple gigabytes... we deactivate
+if not NUMBA_VERBOSE:
+    logger.info(
+        "Numba verbose is deactivated. To enable it, set NUMBA_VERBOSE to 1."
+    )
+
+    nb_logger = logging.getLogger("numba")
+    nb_logger.setLevel(logging.ERROR)  # only show error
+
+    from numba.core.errors import NumbaPerformanceWarning
+
+    warnings.simplefilter("ignore", category=NumbaPerformanceWarning)
+else:
+    logger.info(
+        "Numba verbose is enabled. To deactivate it, set NUMBA_VERBOSE to 0."
+    )
+
+
+@cuda.jit(device=True, inline=True, fastmath=True)
+def cu_logaddexp(a, b):
+    """
+    Compute log(exp(a) + exp(b)) in a numerically stable way.
+
+    Arguments
+    ---------
+    a : float
+        First log value.
+    b : float
+        Second log value.
+
+    Returns
+    -------
+    logaddexp : float
+        The log of the sum of the exponentials.
+    """
+    m = max(a, b)
+    d = abs(a - b)
+    # the correction term is below float32 precision, skip the transcendentals
+    if d > 15.0:
+        return m
+    return m + math.log1p(math.exp(-d))
+
+
+@cuda.jit(device=True, inline=True, fastmath=True)
+def cu_warp_logsumexp(max_value, sum_exp):
+    """
+    Combine the partial log-sum-exp of the lanes of a warp, each lane
+    holding the max of its values and the sum of their exponentials
+    relative to that max. The pairs are merged with shuffles over halving
+    offsets as in a tree reduction.
+
+    Arguments
+    ---------
+    max_value : float
+        Max of the values of the lane.
+    sum_exp : float
+        Sum of exp(value - max_value) over the values of the lane.
+
+    Returns
+    -------
+    max_value : float
+        Max of the values of the whole warp, valid on lane 0.
+    sum_exp : float
+        Sum of exp(value - max_value) over the whole warp, valid on lane 0.
+    """
+    offset = WARP_SIZE // 2
+    while offset > 0:
+        other_max = cuda.shfl_down_sync(FULL_MASK, max_value, offset)
+        other_sum = cuda.shfl_down_sync(FULL_MASK, sum_exp, offset)
+        new_max = max(max_value, other_max)
+        sum_exp = sum_exp * math.exp(
+            max_value - new_max
+        ) + other_sum * math.exp(other_max - new_max)
+        max_value = new_max
+        offset //= 2
+    return max_value, sum_exp
+
+
+@cuda.jit(device=True, inline=True)
+def cu_warp_cell(shape):
+    """
+    Locate the (b, t, u) cell handled by the warp of the current thread, for
+    the kernels launched with one warp per cell.
+
+    Arguments
+    ---------
+    shape : tuple
+        Shape of (batch x TimeLength x LabelLength x outputDim) of the logits.
+
+    Returns
+    -------
+    b : int
+        Batch index, equal to batch for the warps past the last cell.
+    t : int
+        Time index.
+    u : int
+        Label index.
+    lane : int
+        Index of the thread within its warp.
+    """
+    warps_per_block = cuda.blockDim.x // WARP_SIZE
+    cell = cuda.blockIdx.x * warps_per_block + cuda.threadIdx.x // WARP_SIZE
+    b = cell // (shape[1] * shape[2])
+    t = (cell // shape[2]) % shape[1]
+    u = cell % shape[2]
+    return b, t, u, cuda.threadIdx.x % WARP_SIZE
+
+
+@cuda.jit(fastmath=True, cache=True)
+def cu_kernel_logsumexp(logits, logsumexp, T, U):
+    """
+    Compute the log-sum-exp of the logits over the output dim, i.e. the
+    log_softmax normalization. Each warp handles one (b, t, u) cell, its
+    lanes stride over the output dim and are reduced with warp shuffles.
+
+    Arguments
+    ---------
+    logits : torch.Tensor
+        4D Tensor of (batch x TimeLength x LabelLength x outputDim) from the Transducer network.
+    logsumexp : torch.Tensor
+        3D Tensor of (batch x TimeLength x LabelLength) for the log-sum-exp of the logits.
+    T : torch.Tensor
+        1D Tensor of (batch) containing TimeLength of each target.
+    U : torch.Tensor
+        1D Tensor of (batch) containing LabelLength of each target.
+    """
+    b, t, u, lane = cu_warp_cell(logits.shape)
+    # the condition is uniform over the warp, as required by the shuffles
+    if b < logits.shape[0] and t < T[b] and u <= U[b]:
+        # online log-sum-exp over the values of the lane, empty lanes keep a
+        # finite sentinel so that the merges never compute inf - inf
+        max_value = float32(LOG_ZERO)
+        sum_exp = float32(0.0)
+        for k in range(lane, logits.shape[3], WARP_SIZE):
+            x = float32(logits[b, t, u, k])
+            if x > max_value:
+                sum_exp = sum_exp * math.exp(max_value - x) + float32(1.0)
+                max_value = x
+            else:
+                sum_exp += math.exp(x - max_value)
+        max_value, sum_exp = cu_warp_logsumexp(max_value, sum_exp)
+        if lane == 0:
+            logsumexp[b, t, u] = max_value + math.log(sum_exp)
+
+
+@cuda.jit(fastmath=True, cache=True)
+def cu_kernel_log_softmax_grads(grads, logits, logsumexp, labels, T, U, blank):
+    """
+    Turn the gradients with respect to the log_probs into gradients with
+    respect to the logits, in place.
+    With g the gradients of a (b, t, u) cell, the gradient of the logit k
+    is g[k] - softmax[k] * sum(g). Only the blank and label entries of g can
+    be non-zero. Each warp handles one cell and writes its whole output dim.
+
+    Arguments
+    ---------
+    grads : torch.Tensor
+        4D Tensor of (batch x TimeLength x LabelLength x outputDim) of gradients.
+    logits : torch.Tensor
+        4D Tensor of (batch x TimeLength x LabelLength x outputDim) from the Transducer network.
+    logsumexp : torch.Tensor
+        3D Tensor of (batch x TimeLength x LabelLength) containing the log-sum-exp of the logits.
+    labels : torch.Tensor
+        2D Tensor of (batch x MaxSeqLabelLength) containing targets of the batch with zero padding.
+    T : torch.Tensor
+        1D Tensor of (batch) containing TimeLength of each target.
+    U : torch.Tensor
+        1D Tensor of (batch) containing LabelLength of each target.
+    blank : int
+        Blank index.
+    """
+    b, t, u, lane = cu_warp_cell(logits.shape)
+    Ub = U[b] if b < logits.shape[0] else 0
+    if b < logits.shape[0] and (t >= T[b] or u > Ub):
+        # padding, nothing was written by the transducer kernel
+        for k in range(lane, logits.shape[3], WARP_SIZE):
+            grads[b, t, u, k] = 0
+    elif b < logits.shape[0]:
+        grad_blank = float32(grads[b, t, u, blank])
+        label = -1
+        grad_label = float32(0.0)
+        if u < Ub:
+            label = labels[b, u]
+            grad_label = float32(grads[b, t, u, label])
+        # every lane has read the sparse gradients before they get overwritten
+        cuda.syncwarp(FULL_MASK)
+        grad_sum = grad_blank + grad_label
+        for k in range(lane, logits.shape[3], WARP_SIZE):
+            grad = -grad_sum * math.exp(
+                float32(logits[b, t, u, k]) - logsumexp[b, t, u]
+            )
+            if k == blank:
+                grad += grad_blank
+            if k == label:
+                grad += grad_label
+            grads[b, t, u, k] = grad
+
+
+@cuda.jit(device=True, fastmath=True)
+def cu_alpha_cell(lp_blank, lp_label, alpha_prev, b, n, u):
+    """
+    Compute the cell (n - u, u) of alpha for the utterance b, except (0, 0).
+    The previous anti-diagonal is shifted by one along the label axis and
+    holds LOG_ZERO outside of the lattice, so the cells on the t = 0 and
+    u = 0 borders need no special case.
+
+    Arguments
+    ---------
+    lp_blank : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) containing the log probabilities of the blank, stored along the anti-diagonals.
+    lp_label : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) containing the log probabilities of the next label, stored along the anti-diagonals.
+    alpha_prev : numba.cuda.shared.array
+        1D array of (LabelLength + 1) holding alpha[b, n - 1 - u, u] at u + 1 on the previous anti-diagonal.
+    b : int
+        Batch index.
+    n : int
+        Anti-diagonal index, t + u.
+    u : int
+        Label index.
+
+    Returns
+    -------
+    alpha : float
+        The value of alpha[b, n - u, u].
+    """
+    # the entries outside of the lattice, and the clamped index, are only
+    # read when the other term is LOG_ZERO
+    no_emit = alpha_prev[u + 1] + lp_blank[b, n - 1, u]
+    emit = alpha_prev[u] + lp_label[b, n - 1, max(u - 1, 0)]
+    return cu_logaddexp(no_emit, emit)
+
+
+@cuda.jit(device=True, fastmath=True)
+def cu_beta_cell(lp_blank, lp_label, beta_next, b, m, u):
+    """
+    Compute the cell (m - u, u) of beta for the utterance b, except the last
+    one. The next anti-diagonal holds LOG_ZERO outside of the lattice, so
+    the cells on the t = T - 1 and u = U borders need no special case.
+
+    Arguments
+    ---------
+    lp_blank : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) containing the log probabilities of the blank, stored along the anti-diagonals.
+    lp_label : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) containing the log probabilities of the next label, stored along the anti-diagonals.
+    beta_next : numba.cuda.shared.array
+        1D array of (LabelLength + 1) holding beta on the next anti-diagonal.
+    b : int
+        Batch index.
+    m : int
+        Anti-diagonal index, t + u.
+    u : int
+        Label index.
+
+    Returns
+    -------
+    beta : float
+        The value of beta[b, m - u, u].
+    """
+    no_emit = beta_next[u] + lp_blank[b, m, u]
+    emit = beta_next[u + 1] + lp_label[b, m, u]
+    return cu_logaddexp(no_emit, emit)
+
+
+@cuda.jit(device=True)
+def cu_reduce_costs(costs, total, counter, scale):
+    """
+    Reduce the costs of the batch, to be called by one thread of each block
+    once its cost is written. The last block to arrive sums all the costs,
+    in order, and resets the counter for the next launch.
+
+    Arguments
+    ---------
+    costs : torch.Tensor
+        1D Tensor of (batch) containing the cost of each utterance.
+    total : torch.Tensor
+        1D Tensor of (1) for the reduced cost of the batch.
+    counter : torch.Tensor
+        1D Tensor of (1) of int32 counting the blocks that are done.
+    scale : float
+        Factor applied to the sum of the costs.
+    """
+    # make the cost of this block visible to the other blocks first
+    cuda.threadfence()
+    n_blocks = cuda.gridDim.x
+    if cuda.atomic.add(counter, 0, 1) == n_blocks - 1:
+        acc = 0.0
+        for i in range(n_blocks):
+            # atomic read, bypasses the non-coherent L1 cache
+            acc += cuda.atomic.add(costs, i, 0)
+        total[0] = acc * scale
+        counter[0] = 0
+
+
+@cuda.jit(fastmath=True, cache=True)
+def cu_kernel_transducer(
+    lp_blank,
+    lp_label,
+    alpha,
+    beta,
+    costs,
+    total,
+    counter,
+    scale,
+    T,
+    U,
+    order,
+):
+    """
+    Compute the forward-backward algorithm in a single Numba cuda kernel.
+    Sequence Transduction with naive implementation : https://arxiv.org/pdf/1211.3711.pdf
+
+    Each block handles one utterance. The cells of alpha and beta are visited
+    along the anti-diagonals t + u, every cell of a diagonal only depends on
+    the neighbouring diagonal and is computed in parallel. The forward and
+    backward recurrences are independent and advance together. The
+    recurrences only read the log probabilities of the blank and of the
+    next label, gathered beforehand in dense tensors. The gradients are
+    computed by cu_kernel_transducer_grads during the backward pass.
+
+    All the (batch x TimeLength x LabelLength) tensors are stored along
+    their anti-diagonals, x[b, t + u, u] holding the cell (t, u), so that
+    the threads of a diagonal access consecutive memory.
+
+    Arguments
+    ---------
+    lp_blank : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) containing the log probabilities of the blank.
+    lp_label : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) containing the log probabilities of labels[b, u].
+    alpha : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) for forward computation.
+    beta : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) for backward computation.
+    costs : torch.Tensor
+        1D Tensor of (batch) for the cost of each utterance.
+    total : torch.Tensor
+        1D Tensor of (1) for the reduced cost of the batch.
+    counter : torch.Tensor
+        1D Tensor of (1) of int32, must be zero when the kernel starts and is zero again when it ends.
+    scale : float
+        Factor applied to the sum of the costs, e.g. 1 / batch for the mean.
+    T : torch.Tensor
+        1D Tensor of (batch) containing TimeLength of each target.
+    U : torch.Tensor
+        1D Tensor of (batch) containing LabelLength of each target.
+    order : torch.Tensor
+        1D Tensor of (batch) of int32 containing the utterance handled by each block, longest first.
+    """
+    # parallelize over batch (blocks) and target length or time (threads),
+    # the blocks of the longest utterances are scheduled first so that the
+    # short ones fill the gaps instead of trailing at the end of the launch
+    b = order[cuda.blockIdx.x]
+    tid = cuda.threadIdx.x
+    n_threads = cuda.blockDim.x
+    # lengths of the utterance, loaded once
+    Tb = T[b]
+    Ub = U[b]
+
+    # the last two anti-diagonals of alpha and beta are kept in shared
+    # memory, the recurrences only read from there. alpha is shifted by one
+    # along the label axis, index 0 of alpha and index U + 1 of beta stand
+    # for the cells before the lattice and always hold LOG_ZERO. The shared
+    # memory is sized at launch to four rows of LabelLength + 1 entries, the
+    # two diagonals of alpha followed by the two diagonals of beta
+    width = lp_blank.shape[2] + 1
+    shared = cuda.shared.array(0, dtype=float32)
+    alpha_diag = shared[: 2 * width]
+    beta_diag = shared[2 * width : 4 * width]
+
+    # the first diagonal of alpha, (0, 0), and of beta, (T - 1, U), are the
+    # seeds of the recurrences and written along with the borders
+    n_diags = Tb + Ub
+    last = (n_diags - 1) % 2
+    for u in range(tid, Ub + 2, n_threads):
+        alpha_diag[u] = 0.0 if u == 1 else LOG_ZERO
+        alpha_diag[width + u] = LOG_ZERO
+        beta_diag[(1 - last) * width + u] = LOG_ZERO
+        if u == Ub:
+            beta_diag[last * width + u] = lp_blank[b, n_diags - 1, Ub]
+        else:
+            beta_diag[last * width + u] = LOG_ZERO
+    if tid == 0:
+        alpha[b, 0, 0] = 0.0
+        beta[b, n_diags - 1, Ub] = lp_blank[b, n_diags - 1, Ub]
+    cuda.syncthreads()
+
+    # alpha and beta are independent, at each step the block computes the
+    # diagonal n = t + u of alpha and the diagonal m of beta, counted from
+    # the end, then waits for the whole block before moving to the next step.
+    # The cells outside of the lattice are set to LOG_ZERO for the next step.
+    for n in range(1, n_diags):
+        m = n_diags - 1 - n
+        alpha_prev = alpha_diag[((n + 1) % 2) * width :]
+        beta_next = beta_diag[((m + 1) % 2) * width :]
+        for u in range(tid, Ub + 1, n_threads):
+            t = n - u
+            value = LOG_ZERO
+            if t >= 0 and t < Tb:
+                value = cu_alpha_cell(lp_blank, lp_label, alpha_prev, b, n, u)
+                alpha[b, n, u] = value
+            alpha_diag[(n % 2) * width + u + 1] = value
+            t = m - u
+            value = LOG_ZERO
+            if t >= 0 and t < Tb:
+                value = cu_beta_cell(lp_blank, lp_label, beta_next, b, m, u)
+                beta[b, m, u] = value
+            beta_diag[(m % 2) * width + u] = value
+        cuda.syncthreads()
+
+    # the last cell of alpha is still in the last shared diagonal
+    alpha_end = alpha_diag[last * width + Ub + 1]
+    if tid == 0:
+        # for each block b (utterance)
+        # normalize the loss over time
+        costs[b] = -(alpha_end + lp_blank[b, n_diags - 1, Ub]) / Tb
+        cu_reduce_costs(costs, total, counter, scale)
+
+
+@cuda.jit(fastmath=True, cache=True)
+def cu_kernel_transducer_grads(
+    lp_blank,
+    lp_label,
+    labels,
+    alpha,
+    beta,
+    grads,
+    grad_scale,
+    T,
+    U,
+    blank,
+    order,
+):
+    """
+    Compute the gradients of the transducer loss with respect to the
+    log_probs, scaled by the gradient of the output as they are written.
+    Each block handles one utterance and each thread one (t, u) cell, only
+    the blank and label entries of the output dim can be non-zero. The
+    (batch x TimeLength x LabelLength) tensors are stored along their
+    anti-diagonals as in cu_kernel_transducer.
+
+    Arguments
+    ---------
+    lp_blank : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) containing the log probabilities of the blank.
+    lp_label : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) containing the log probabilities of labels[b, u].
+    labels : torch.Tensor
+        2D Tensor of (batch x MaxSeqLabelLength) containing targets of the batch with zero padding.
+    alpha : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) from the forward computation.
+    beta : torch.Tensor
+        3D Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) from the backward computation.
+    grads : torch.Tensor
+        4D Tensor of (batch x TimeLength x LabelLength x outputDim) for the gradients, only its blank and label entries are written.
+    grad_scale : torch.Tensor
+        1D Tensor of (batch) of float32 containing the factor of the gradients of each utterance.
+    T : torch.Tensor
+        1D Tensor of (batch) containing TimeLength of each target.
+    U : torch.Tensor
+        1D Tensor of (batch) containing LabelLength of each target.
+    blank : int
+        Blank index.
+    order : torch.Tensor
+        1D Tensor of (batch) of int32 containing the utterance handled by each block, longest first.
+    """
+    b = order[cuda.blockIdx.x]
+    tid = cuda.threadIdx.x
+    n_threads = cuda.blockDim.x
+    Tb = T[b]
+    Ub = U[b]
+    log_norm = beta[b, 0, 0]
+    scale = grad_scale[b]
+
+    # gradients: one thread per (t, u) cell, visited along the diagonals
+    # with u as the fastest varying index so that neighbouring threads
+    # access neighbouring memory
+    for idx in range(tid, (Tb + Ub) * (Ub + 1), n_threads):
+        d = idx // (Ub + 1)
+        u = idx % (Ub + 1)
+        t = d - u
+        if t < 0 or t >= Tb:
+            continue
+        # compute the gradient for no_emit prob
+        if t < Tb - 1:
+            grads[b, t, u, blank] = -scale * math.exp(
+                alpha[b, d, u]
+                + beta[b, d + 1, u]
+                + lp_blank[b, d, u]
+                - log_norm
+            )
+        elif u == Ub:
+            grads[b, t, u, blank] = -scale * math.exp(
+                alpha[b, d, u] + lp_blank[b, d, u] - log_norm
+            )
+        else:
+            grads[b, t, u, blank] = 0
+        # compute the gradient for emit prob
+        if u < Ub:
+            label = labels[b, u]
+            grads[b, t, u, label] = -scale * math.exp(
+                alpha[b, d, u]
+                + beta[b, d + 1, u + 1]
+                + lp_label[b, d, u]
+                - log_norm
+            )
@@ -1,14 +1,12 @@
 """
-Transducer loss implementation (depends on numba)
+Transducer loss implementation (the numba backend depends on numba)
 
 Authors
  * Abdelwahab Heba 2020
  * Titouan Parcollet 2023
 """
 
-import logging
 import math
-import warnings
 
 import torch
 from torch.autograd import Function
@@ -16,245 +14,399 @@ from torch.nn import Module
 
 from speechbrain.utils.logger import get_logger
 
-NUMBA_VERBOSE = 0
+# the constants compiled into the kernels (WARP_SIZE, MAX_LABEL_LENGTH)
+# live in _transducer_kernels, so that its numba cache follows them
+MAX_THREADS_PER_BLOCK = 1024
+REDUCTIONS = ("mean", "sum", "none")
+BACKENDS = ("auto", "torchaudio", "numba")
+# warps of the kernels launched with one warp per (b, t, u) cell
+WARPS_PER_BLOCK = 4
 
 logger = get_logger(__name__)
 
-try:
-    from numba import cuda
+# the numba kernels, imported on first use
+_KERNELS = None
 
-    # Numba is extra verbose and this may lead to log.txt file of multiple gigabytes... we deactivate
-    if not NUMBA_VERBOSE:
-        logger.info(
-            "Numba verbose is deactivated. To enable it, set NUMBA_VERBOSE to 1."
-        )
 
-        nb_logger = logging.getLogger("numba")
-        nb_logger.setLevel(logging.ERROR)  # only show error
+def _get_kernels():
+    """Returns the module holding the numba kernels, importing numba and the
+    kernels on the first call only, so that importing this module stays
+    cheap when the numba backend is not used.
+
+    Returns
+    -------
+    kernels : module
+        The speechbrain.nnet.loss._transducer_kernels module.
+    """
+    global _KERNELS
+    if _KERNELS is None:
+        try:
+            from speechbrain.nnet.loss import _transducer_kernels
+        except ImportError:
+            err_msg = "The optional dependency Numba is needed to use the numba backend\n"
+            err_msg += "Cannot import numba. To use Transducer loss\n"
+            err_msg += "Please follow the instructions below\n"
+            err_msg += "=============================\n"
+            err_msg += "If you use your localhost:\n"
+            err_msg += "pip install numba\n"
+            err_msg += "================================ \n"
+            err_msg += "If you use conda:\n"
+            err_msg += "conda install numba cudatoolkit"
+            raise ImportError(err_msg)
+        _KERNELS = _transducer_kernels
+    return _KERNELS
+
+
+def _current_stream(device):
+    """Returns the current PyTorch stream of the device as a numba stream,
+    the kernels launched on it are ordered with the PyTorch operations.
+
+    Arguments
+    ---------
+    device : torch.device
+        Device of the tensors given to the kernels.
+
+    Returns
+    -------
+    stream : numba.cuda.cudadrv.driver.Stream
+        The numba handle on the stream.
+    """
+    return _get_kernels().cuda.external_stream(
+        torch.cuda.current_stream(device).cuda_stream
+    )
+
+
+def _workspace_buffers(workspace, shape, device, dtype):
+    """Returns alpha and beta buffers taken from a storage cached in the
+    workspace, the storage is only reallocated when it is too small.
+
+    Arguments
+    ---------
+    workspace : dict
+        Cache of the storages, indexed by device and dtype.
+    shape : tuple
+        Shape of each buffer.
+    device : torch.device
+        Device of the buffers.
+    dtype : torch.dtype
+        Data type of the buffers.
+
+    Returns
+    -------
+    alpha : torch.Tensor
+        Uninitialized buffer for the forward computation.
+    beta : torch.Tensor
+        Uninitialized buffer for the backward computation.
+    """
+    key = (device, dtype)
+    size = math.prod(shape)
+    storage = workspace.get(key)
+    if storage is None or storage.numel() < 2 * size:
+        storage = torch.empty((2 * size,), device=device, dtype=dtype)
+        workspace[key] = storage
+    return storage[:size].view(shape), storage[size : 2 * size].view(shape)
+
 
-        from numba.core.errors import NumbaPerformanceWarning
+def _transducer_buffers(log_probs, workspace=None, for_backward=False):
+    """Returns the buffers written by the transducer kernel.
 
-        warnings.simplefilter("ignore", category=NumbaPerformanceWarning)
+    Arguments
+    ---------
+    log_probs : torch.Tensor
+        Tensor of (batch x TimeLength x LabelLength x outputDim) given to
+        the kernels.
+    workspace : dict
+        If given, alpha, beta and the counter are taken from this cache.
+    for_backward : bool
+        If True, alpha and beta are kept for the backward pass and are not
+        taken from the workspace, where the next call would overwrite them.
+
+    Returns
+    -------
+    buffers : dict
+        The alpha, beta, costs, total and counter tensors.
+    """
+    B, maxT, maxU, _ = log_probs.shape
+    device = log_probs.device
+    # every value read by the kernel is written by the kernel first, alpha
+    # and beta are stored along their anti-diagonals
+    shape = (B, maxT + maxU - 1, maxU)
+    if workspace is None or for_backward:
+        alpha = torch.empty(shape, device=device, dtype=torch.float32)
+        beta = torch.empty(shape, device=device, dtype=torch.float32)
     else:
-        logger.info(
-            "Numba verbose is enabled. To deactivate it, set NUMBA_VERBOSE to 0."
+        alpha, beta = _workspace_buffers(
+            workspace, shape, device, torch.float32
         )
+    # the kernel leaves the counter to zero, it can be reused as is
+    counter_key = ("counter", device)
+    counter = None if workspace is None else workspace.get(counter_key)
+    if counter is None:
+        counter = torch.zeros((1,), device=device, dtype=torch.int32)
+        if workspace is not None:
+            workspace[counter_key] = counter
+    return {
+        "alpha": alpha,
+        "beta": beta,
+        "costs": torch.empty((B,), device=device, dtype=torch.float32),
+        "total": torch.empty((1,), device=device, dtype=torch.float32),
+        "counter": counter,
+    }
+
+
+def _skew(x):
+    """Returns a copy of x stored along its anti-diagonals, the cells (t, u)
+    and (t - 1, u + 1) being next to each other.
+
+    Arguments
+    ---------
+    x : torch.Tensor
+        Tensor of (batch x TimeLength x LabelLength).
 
-except ImportError:
-    err_msg = "The optional dependency Numba is needed to use this module\n"
-    err_msg += "Cannot import numba. To use Transducer loss\n"
-    err_msg += "Please follow the instructions below\n"
-    err_msg += "=============================\n"
-    err_msg += "If you use your localhost:\n"
-    err_msg += "pip install numba\n"
-    err_msg += "export NUMBAPRO_LIBDEVICE='/usr/local/cuda/nvvm/libdevice/' \n"
-    err_msg += "export NUMBAPRO_NVVM='/usr/local/cuda/nvvm/lib64/libnvvm.so' \n"
-    err_msg += "================================ \n"
-    err_msg += "If you use conda:\n"
-    err_msg += "conda install numba cudatoolkit"
-    raise ImportError(err_msg)
-
-
-@cuda.jit()
-def cu_kernel_forward(log_probs, labels, alpha, log_p, T, U, blank, lock):
+    Returns
+    -------
+    skewed : torch.Tensor
+        Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) with
+        skewed[:, t + u, u] = x[:, t, u], the entries that are not cells of
+        x hold copies of a cell of the same column.
     """
-    Compute forward pass for the forward-backward algorithm using Numba cuda kernel.
-    Sequence Transduction with naive implementation : https://arxiv.org/pdf/1211.3711.pdf
+    _, maxT, maxU = x.shape
+    d = torch.arange(maxT + maxU - 1, device=x.device).unsqueeze(1)
+    u = torch.arange(maxU, device=x.device)
+    return x[:, (d - u).clamp(0, maxT - 1), u]
+
+
+def _gather_log_probs(log_probs, logsumexp, labels, U, blank):
+    """Gathers the log probabilities of the blank and of the labels, the
+    only entries of the output dim read by the recurrences, in dense
+    tensors so that the kernel does not stride over the output dim.
 
     Arguments
     ---------
     log_probs : torch.Tensor
-        4D Tensor of (batch x TimeLength x LabelLength x outputDim) from the Transducer network.
+        Tensor of (batch x TimeLength x LabelLength x outputDim).
+    logsumexp : torch.Tensor
+        Tensor of (batch x TimeLength x LabelLength) subtracted from
+        log_probs, None if log_probs is already normalized.
     labels : torch.Tensor
-        2D Tensor of (batch x MaxSeqLabelLength) containing targets of the batch with zero padding.
-    alpha : torch.Tensor
-        3D Tensor of (batch x TimeLength x LabelLength) for forward computation.
-    log_p : torch.Tensor
-        1D Tensor of (batch) for forward cost computation.
-    T : torch.Tensor
-        1D Tensor of (batch) containing TimeLength of each target.
+        Tensor of (batch x MaxSeqLabelLength) containing the targets, with
+        at most LabelLength-1 columns read.
     U : torch.Tensor
-        1D Tensor of (batch) containing LabelLength of each target.
+        Tensor of (batch) containing the label length of each target.
     blank : int
         Blank index.
-    lock : torch.Tensor
-        2D Tensor of (batch x LabelLength) containing bool(1-0) lock for parallel computation.
-    """
 
-    # parallelize the forward algorithm over batch and target length dim
-    b = cuda.blockIdx.x
-    u = cuda.threadIdx.x
-    t = 0
-    if u <= U[b]:
-        # for each (B,U) Thread
-        # wait the unlock of the previous computation of Alpha[b,U-1,:]
-        # Do the computation over the whole Time sequence on alpha[B,U,:]
-        # and then unlock the target U+1 for computation
-        while t < T[b]:
-            if u == 0:
-                if t > 0:
-                    alpha[b, t, 0] = (
-                        alpha[b, t - 1, 0] + log_probs[b, t - 1, 0, blank]
-                    )
-                cuda.atomic.add(lock, (b, u + 1), -1)
-                t += 1
-            else:
-                if cuda.atomic.add(lock, (b, u), 0) < 0:
-                    if t == 0:
-                        alpha[b, 0, u] = (
-                            alpha[b, 0, u - 1]
-                            + log_probs[b, 0, u - 1, labels[b, u - 1]]
-                        )
-                    else:
-                        # compute emission prob
-                        emit = (
-                            alpha[b, t, u - 1]
-                            + log_probs[b, t, u - 1, labels[b, u - 1]]
-                        )
-                        # compute no_emission prob
-                        no_emit = (
-                            alpha[b, t - 1, u] + log_probs[b, t - 1, u, blank]
-                        )
-                        # do logsumexp between log_emit and log_no_emit
-                        alpha[b, t, u] = max(no_emit, emit) + math.log1p(
-                            math.exp(-abs(no_emit - emit))
-                        )
-                    if u < U[b]:
-                        cuda.atomic.add(lock, (b, u + 1), -1)
-                    cuda.atomic.add(lock, (b, u), 1)
-                    t += 1
-        if u == U[b]:
-            # for each thread b (utterance)
-            # normalize the loss over time
-            log_p[b] = (
-                alpha[b, T[b] - 1, U[b]] + log_probs[b, T[b] - 1, U[b], blank]
-            ) / T[b]
-
-
-@cuda.jit()
-def cu_kernel_backward(log_probs, labels, beta, log_p, T, U, blank, lock):
+    Returns
+    -------
+    lp_blank : torch.Tensor
+        Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) of
+        float32 containing the log probabilities of the blank, stored along
+        the anti-diagonals as by _skew.
+    lp_label : torch.Tensor
+        Tensor of (batch x TimeLength + LabelLength - 1 x LabelLength) of
+        float32 containing the log probabilities of labels[b, u], stored as
+        lp_blank. The positions past U[b] have no label and hold the blank.
     """
-    Compute backward pass for the forward-backward algorithm using Numba cuda kernel.
-    Sequence Transduction with naive implementation : https://arxiv.org/pdf/1211.3711.pdf
+    B, maxT, maxU, _ = log_probs.shape
+    # labels may be narrower than the label axis of log_probs
+    n_labels = min(labels.shape[1], maxU - 1)
+    index = torch.nn.functional.pad(
+        labels[:, :n_labels].long(), (0, maxU - n_labels), value=blank
+    )
+    # the padding of labels may be any value, even out of the output dim
+    padding = torch.arange(maxU, device=index.device) >= U[:, None]
+    index = index.masked_fill(padding, blank)
+    index = index.view(B, 1, maxU, 1).expand(B, maxT, maxU, 1)
+    lp_blank = log_probs[..., blank].float()
+    lp_label = log_probs.gather(3, index).squeeze(3).float()
+    if logsumexp is not None:
+        lp_blank = lp_blank - logsumexp
+        lp_label = lp_label - logsumexp
+    return _skew(lp_blank), _skew(lp_label)
+
+
+def _launch_transducer(
+    log_probs, labels, T, U, blank, reduction, fused_log_softmax, buffers
+):
+    """Launches the kernels of the forward pass on the current stream, the
+    results are written into the buffers.
 
     Arguments
     ---------
     log_probs : torch.Tensor
-        4D Tensor of (batch x TimeLength x LabelLength x outputDim) from the Transducer network.
+        Tensor of (batch x TimeLength x LabelLength x outputDim).
     labels : torch.Tensor
-        2D Tensor of (batch x MaxSeqLabelLength) containing targets of the batch with zero padding.
-    beta : torch.Tensor
-        3D Tensor of (batch x TimeLength x LabelLength) for backward computation.
-    log_p : torch.Tensor
-        1D Tensor of (batch) for backward cost computation.
+        Tensor of (batch x LabelLength-1) containing the targets.
     T : torch.Tensor
-        1D Tensor of (batch) containing TimeLength of each target.
+        Tensor of (batch) containing the sequence lengths.
     U : torch.Tensor
-        1D Tensor of (batch) containing LabelLength of each target.
+        Tensor of (batch) containing the label lengths.
     blank : int
         Blank index.
-    lock : torch.Tensor
-        2D Tensor of (batch x LabelLength) containing bool(1-0) lock for parallel computation.
+    reduction : str
+        One of "mean", "sum" or "none".
+    fused_log_softmax : bool
+        Whether log_probs are unnormalized logits.
+    buffers : dict
+        Buffers from _transducer_buffers, "lp_blank", "lp_label", "order"
+        and, with fused_log_softmax, "logsumexp" are added to them.
     """
-    # parallelize the forward algorithm over batch and target length dim
-    b = cuda.blockIdx.x
-    u = cuda.threadIdx.x
-    t = T[b] - 1
-    if u <= U[b]:
-        # for each (B,U) Thread
-        # wait the unlock of the next computation of beta[b,U+1,:]
-        # Do the computation over the whole Time sequence on beta[B,U,:]
-        # and then unlock the target U-1 for computation
-        while t >= 0:
-            if u == U[b]:
-                if t == T[b] - 1:
-                    beta[b, t, u] = log_probs[b, t, u, blank]
-                else:
-                    beta[b, t, u] = (
-                        beta[b, t + 1, u] + log_probs[b, t, u, blank]
-                    )
-                cuda.atomic.add(lock, (b, u - 1), -1)
-                t -= 1
-            else:
-                if cuda.atomic.add(lock, (b, u), 0) < 0:
-                    if t == T[b] - 1:
-                        # do logsumexp between log_emit and log_no_emit
-                        beta[b, t, u] = (
-                            beta[b, t, u + 1] + log_probs[b, t, u, labels[b, u]]
-                        )
-                    else:
-                        # compute emission prob
-                        emit = (
-                            beta[b, t, u + 1] + log_probs[b, t, u, labels[b, u]]
-                        )
-                        # compute no_emission prob
-                        no_emit = beta[b, t + 1, u] + log_probs[b, t, u, blank]
-                        # do logsumexp between log_emit and log_no_emit
-                        beta[b, t, u] = max(no_emit, emit) + math.log1p(
-                            math.exp(-abs(no_emit - emit))
-                        )
-                    if u > 0:
-                        cuda.atomic.add(lock, (b, u - 1), -1)
-                    cuda.atomic.add(lock, (b, u), 1)
-                    t -= 1
-    if u == 0:
-        # for each thread b (utterance)
-        # normalize the loss over time
-        log_p[b] = beta[b, 0, 0] / T[b]
-
-
-@cuda.jit()
-def cu_kernel_compute_grad(log_probs, labels, alpha, beta, grads, T, U, blank):
+    B, maxT, maxU, _ = log_probs.shape
+    kernels = _get_kernels()
+    stream = _current_stream(log_probs.device)
+    logsumexp = None
+    if fused_log_softmax:
+        logsumexp = buffers.get("logsumexp")
+        if logsumexp is None:
+            logsumexp = torch.empty(
+                (B, maxT, maxU), device=log_probs.device, dtype=torch.float32
+            )
+        n_blocks = math.ceil(B * maxT * maxU / WARPS_PER_BLOCK)
+        kernels.cu_kernel_logsumexp[
+            n_blocks, WARPS_PER_BLOCK * kernels.WARP_SIZE, stream
+        ](log_probs, logsumexp, T, U)
+        buffers["logsumexp"] = logsumexp
+    lp_blank, lp_label = _gather_log_probs(
+        log_probs, logsumexp, labels, U, blank
+    )
+    buffers["lp_blank"] = lp_blank
+    buffers["lp_label"] = lp_label
+    # the longest utterances first, the blocks have very unequal durations
+    # when the lengths are spread
+    order = torch.argsort(T, descending=True).int()
+    buffers["order"] = order
+    # one block per utterance, the threads cover the label axis and the
+    # shared memory holds four float32 diagonals of maxU + 1 entries
+    kernels.cu_kernel_transducer[
+        B, _recurrence_threads(maxU), stream, 4 * 4 * (maxU + 1)
+    ](
+        lp_blank,
+        lp_label,
+        buffers["alpha"],
+        buffers["beta"],
+        buffers["costs"],
+        buffers["total"],
+        buffers["counter"],
+        1.0 / B if reduction == "mean" else 1.0,
+        T,
+        U,
+        order,
+    )
+
+
+def _recurrence_threads(maxU):
+    """Returns the number of threads per block of the alpha and beta
+    recurrences, one thread per cell of a diagonal rounded up to whole
+    warps.
+
+    Arguments
+    ---------
+    maxU : int
+        Size of the label axis.
+
+    Returns
+    -------
+    n_threads : int
+        Threads of each block.
     """
-    Compute gradient for the forward-backward algorithm using Numba cuda kernel.
-    Sequence Transduction with naive implementation : https://arxiv.org/pdf/1211.3711.pdf
+    warp_size = _get_kernels().WARP_SIZE
+    n_warps = math.ceil((maxU + 1) / warp_size)
+    return min(n_warps * warp_size, MAX_THREADS_PER_BLOCK)
+
+
+def _n_threads(maxT, maxU):
+    """Returns the number of threads per block of the gradients kernel,
+    which covers the whole (T, U) grid.
 
     Arguments
     ---------
+    maxT : int
+        Size of the time axis.
+    maxU : int
+        Size of the label axis.
+
+    Returns
+    -------
+    n_threads : int
+        Threads of each block.
+    """
+    return min(maxT * maxU, MAX_THREADS_PER_BLOCK)
+
+
+def _replay_transducer_graph(
+    workspace, log_probs, labels, T, U, blank, reduction, fused_log_softmax
+):
+    """Runs the forward kernels through a CUDA graph captured on the first
+    call with a given shape and replayed afterwards, which removes the
+    launch overhead of small batches.
+
+    The graph reads its inputs from static copies and writes into its own
+    buffers, both kept in the workspace, the results are cloned so that
+    the next replay does not overwrite them.
+
+    Arguments
+    ---------
+    workspace : dict
+        Cache of the graphs, indexed by the shapes and options.
     log_probs : torch.Tensor
-        4D Tensor of (batch x TimeLength x LabelLength x outputDim) from the Transducer network.
+        Tensor of (batch x TimeLength x LabelLength x outputDim).
     labels : torch.Tensor
-        2D Tensor of (batch x MaxSeqLabelLength) containing targets of the batch with zero padding.
-    alpha : torch.Tensor
-        3D Tensor of (batch x TimeLength x LabelLength) for backward computation.
-    beta : torch.Tensor
-        3D Tensor of (batch x TimeLength x LabelLength) for backward computation.
-    grads : torch.Tensor
-        Grads for backward computation.
+        Tensor of (batch x LabelLength-1) containing the targets.
     T : torch.Tensor
-        1D Tensor of (batch) containing TimeLength of each target.
+        Tensor of (batch) containing the sequence lengths.
     U : torch.Tensor
-        1D Tensor of (batch) containing LabelLength of each target.
+        Tensor of (batch) containing the label lengths.
     blank : int
         Blank index.
+    reduction : str
+        One of "mean", "sum" or "none".
+    fused_log_softmax : bool
+        Whether log_probs are unnormalized logits.
+
+    Returns
+    -------
+    buffers : dict
+        Copies of the buffers used by the backward pass.
     """
-    # parallelize the gradient computation over batch and timeseq length dim
-    t = cuda.blockIdx.x
-    b = cuda.threadIdx.x
-    if t < T[b]:
-        # compute the gradient for no_emit prob
-        if t == 0:
-            grads[b, T[b] - 1, U[b], blank] = -math.exp(
-                alpha[b, T[b] - 1, U[b]]
-                + log_probs[b, T[b] - 1, U[b], blank]
-                - beta[b, 0, 0]
+    inputs = (log_probs, labels, T, U)
+    key = ("graph", blank, reduction, fused_log_softmax) + tuple(
+        (tuple(x.shape), x.dtype, x.device) for x in inputs
+    )
+    entry = workspace.get(key)
+    if entry is None:
+        static_inputs = tuple(x.clone() for x in inputs)
+        buffers = _transducer_buffers(log_probs)
+        # the eager run compiles the kernels before the capture
+        _launch_transducer(
+            *static_inputs, blank, reduction, fused_log_softmax, buffers
+        )
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            _launch_transducer(
+                *static_inputs, blank, reduction, fused_log_softmax, buffers
             )
-
-        if t < T[b] - 1:
-            for u in range(U[b] + 1):
-                grads[b, t, u, blank] = alpha[b, t, u] + beta[b, t + 1, u]
-                grads[b, t, u, blank] = -math.exp(
-                    grads[b, t, u, blank]
-                    + log_probs[b, t, u, blank]
-                    - beta[b, 0, 0]
-                )
-        # compute the gradient for emit prob
-        for u, l in enumerate(labels[b]):
-            if u < U[b]:
-                grads[b, t, u, l] = alpha[b, t, u] + beta[b, t, u + 1]
-                grads[b, t, u, l] = -math.exp(
-                    grads[b, t, u, l] + log_probs[b, t, u, l] - beta[b, 0, 0]
-                )
+        workspace[key] = (graph, static_inputs, buffers)
+        # the capture replaced some buffers by tensors of the graph pool,
+        # they are only written once the graph runs
+        graph.replay()
+    else:
+        graph, static_inputs, buffers = entry
+        for static, x in zip(static_inputs, inputs):
+            static.copy_(x, non_blocking=True)
+        graph.replay()
+    # the counter is not needed after the forward
+    names = [
+        "alpha",
+        "beta",
+        "lp_blank",
+        "lp_label",
+        "order",
+        "costs",
+        "total",
+    ]
+    if fused_log_softmax:
+        names.append("logsumexp")
+    return {name: buffers[name].clone() for name in names}
 
 
 class Transducer(Function):
@@ -271,55 +423,141 @@ class Transducer(Function):
     """
 
     @staticmethod
-    def forward(ctx, log_probs, labels, T, U, blank, reduction):
-        """Computes the transducer loss."""
+    def forward(
+        ctx,
+        log_probs,
+        labels,
+        T,
+        U,
+        blank,
+        reduction,
+        workspace=None,
+        fused_log_softmax=False,
+        use_cuda_graph=False,
+        normalize_grads=False,
+    ):
+        """Computes the transducer loss.
+
+        log_probs can be stored in float16 to halve the memory traffic, the
+        computations are always done in float32. The gradients are only
+        computed by the backward pass, from alpha and beta. When no gradient
+        is needed, the optional workspace dict holds the alpha and beta
+        buffers across calls, they are only reallocated when a larger batch
+        comes in. With fused_log_softmax, log_probs are unnormalized logits
+        and the log_softmax is computed by the kernels, gradients being
+        returned for the logits. With use_cuda_graph and a workspace, the
+        kernels are captured in a CUDA graph per shape and replayed on the
+        next calls with the same shape.
+
+        The costs are divided by the sequence lengths. As in the original
+        implementation, the gradients are those of the sum of the costs
+        before this division, scaled by the gradient of the output. With
+        normalize_grads, they are the gradients of the returned loss.
+        """
+        if reduction not in REDUCTIONS:
+            raise ValueError(
+                f"Unexpected reduction {reduction}, expected one of {REDUCTIONS}"
+            )
         log_probs = log_probs.detach()
         B, maxT, maxU, A = log_probs.shape
-        grads = torch.zeros(
-            (B, maxT, maxU, A), dtype=log_probs.dtype, device=log_probs.device
-        )
-        alpha = torch.zeros(
-            (B, maxT, maxU), device=log_probs.device, dtype=log_probs.dtype
-        )
-        beta = torch.zeros(
-            (B, maxT, maxU), device=log_probs.device, dtype=log_probs.dtype
-        )
-        lock = torch.zeros(
-            (B, maxU), dtype=torch.int32, device=log_probs.device
-        )
-        log_p_alpha = torch.zeros(
-            (B,), device=log_probs.device, dtype=log_probs.dtype
-        )
-        log_p_beta = torch.zeros(
-            (B,), device=log_probs.device, dtype=log_probs.dtype
-        )
-        cu_kernel_forward[B, maxU](
-            log_probs, labels, alpha, log_p_alpha, T, U, blank, lock
-        )
-        lock = lock * 0
-        cu_kernel_backward[B, maxU](
-            log_probs, labels, beta, log_p_beta, T, U, blank, lock
-        )
-        cu_kernel_compute_grad[maxT, B](
-            log_probs, labels, alpha, beta, grads, T, U, blank
-        )
-        ctx.grads = grads
-        del alpha, beta, lock, log_p_beta, T, U, log_probs, labels
-        torch.cuda.empty_cache()
-        if reduction == "mean":
-            return -log_p_alpha.mean()
-        elif reduction == "sum":
-            return sum(-log_p_alpha)
-        elif reduction == "none":
-            return -log_p_alpha
+        if log_probs.dtype == torch.bfloat16:
+            raise ValueError(
+                "bfloat16 is not supported by numba, use float16 instead."
+            )
+        max_label_length = _get_kernels().MAX_LABEL_LENGTH
+        if maxU > max_label_length:
+            raise ValueError(
+                f"The label axis of log_probs has size {maxU} while at most {max_label_length} is supported."
+            )
+        if use_cuda_graph and workspace is not None:
+            buffers = _replay_transducer_graph(
+                workspace,
+                log_probs,
+                labels,
+                T,
+                U,
+                blank,
+                reduction,
+                fused_log_softmax,
+            )
         else:
-            raise Exception("Unexpected reduction {}".format(reduction))
+            buffers = _transducer_buffers(
+                log_probs, workspace, ctx.needs_input_grad[0]
+            )
+            _launch_transducer(
+                log_probs,
+                labels,
+                T,
+                U,
+                blank,
+                reduction,
+                fused_log_softmax,
+                buffers,
+            )
+        ctx.shape = log_probs.shape
+        ctx.dtype = log_probs.dtype
+        ctx.alpha = buffers["alpha"]
+        ctx.beta = buffers["beta"]
+        ctx.lp_blank = buffers["lp_blank"]
+        ctx.lp_label = buffers["lp_label"]
+        ctx.order = buffers["order"]
+        ctx.blank = blank
+        ctx.reduction = reduction
+        ctx.normalize_grads = normalize_grads
+        ctx.n_threads = _n_threads(maxT, maxU)
+        ctx.fused_log_softmax = fused_log_softmax
+        if fused_log_softmax:
+            ctx.logits = log_probs
+            ctx.logsumexp = buffers["logsumexp"]
+        ctx.save_for_backward(labels, T, U)
+        if reduction == "none":
+            return buffers["costs"]
+        return buffers["total"][0]
 
     @staticmethod
     def backward(ctx, grad_output):
         """Backward computations for the transducer loss."""
-        grad_output = grad_output.view(-1, 1, 1, 1).to(ctx.grads)
-        return ctx.grads.mul_(grad_output), None, None, None, None, None, None
+        labels, T, U = ctx.saved_tensors
+        B, maxT, maxU, _ = ctx.shape
+        # factor of the gradients of each utterance
+        grad_scale = grad_output.float().reshape(-1).expand(B)
+        if ctx.normalize_grads:
+            grad_scale = grad_scale / T
+            if ctx.reduction == "mean":
+                grad_scale = grad_scale / B
+        grad_scale = grad_scale.contiguous()
+        kernels = _get_kernels()
+        stream = _current_stream(ctx.alpha.device)
+        # grad_output is applied as the gradients are written, grads follows
+        # the dtype of log_probs. The gradients kernel only writes the blank
+        # and label entries, the log_softmax gradients kernel writes them all
+        if ctx.fused_log_softmax:
+            grads = torch.empty(
+                ctx.shape, dtype=ctx.dtype, device=ctx.alpha.device
+            )
+        else:
+            grads = torch.zeros(
+                ctx.shape, dtype=ctx.dtype, device=ctx.alpha.device
+            )
+        kernels.cu_kernel_transducer_grads[B, ctx.n_threads, stream](
+            ctx.lp_blank,
+            ctx.lp_label,
+            labels,
+            ctx.alpha,
+            ctx.beta,
+            grads,
+            grad_scale,
+            T,
+            U,
+            ctx.blank,
+            ctx.order,
+        )
+        if ctx.fused_log_softmax:
+            n_blocks = math.ceil(B * maxT * maxU / WARPS_PER_BLOCK)
+            kernels.cu_kernel_log_softmax_grads[
+                n_blocks, WARPS_PER_BLOCK * kernels.WARP_SIZE, stream
+            ](grads, ctx.logits, ctx.logsumexp, labels, T, U, ctx.blank)
+        return grads, None, None, None, None, None, None, None, None, None
 
 
 class TransducerLoss(Module):
@@ -327,59 +565,154 @@ class TransducerLoss(Module):
     This class implements the Transduce loss computation with forward-backward algorithm.
     Sequence Transduction with naive implementation : https://arxiv.org/pdf/1211.3711.pdf
 
-    The TransducerLoss(nn.Module) use Transducer(autograd.Function)
-    to compute the forward-backward loss and gradients.
-
-    Input tensors must be on a cuda device.
+    By default, the loss is computed by torchaudio.functional.rnnt_loss when
+    torchaudio is available, which runs on both cpu and cuda devices.
+    Otherwise, the TransducerLoss(nn.Module) use Transducer(autograd.Function)
+    to compute the forward-backward loss and gradients with numba, the numba
+    implementation is kept as a reference and its input tensors must be on a
+    cuda device. With both backends, the cost of each utterance is divided
+    by its sequence length before the reduction, and the gradients are
+    those of the returned loss. Unlike Transducer.apply and
+    speechbrain.nnet.losses.transducer_loss, which keep the gradients of
+    the unnormalized costs, the numba backend thus returns gradients
+    divided by the sequence lengths, and by the batch size for the mean.
 
     Arguments
     ---------
     blank : int
         Token to use as blank token.
     reduction : str
-        Type of reduction to use, default "mean"
+        Type of reduction to use, one of "mean", "sum" or "none", default "mean"
+    dtype : torch.dtype
+        If given, the logits are cast to this type before the log_softmax,
+        e.g. torch.float16 halves the memory traffic of the loss while the
+        computations are still done in float32. bfloat16 is not supported.
+    fused_log_softmax : bool
+        If True, the log_softmax is computed inside the numba kernels instead
+        of being applied to the logits beforehand, which saves a full write
+        and read of the (batch x TimeLength x LabelLength x outputDim) tensor.
+        torchaudio always fuses the log_softmax.
+    use_cuda_graph : bool
+        If True, the kernels are captured in a CUDA graph on the first call
+        with a given shape and the graph is replayed on the next calls with
+        the same shape, which removes the launch overhead when the inputs
+        are padded to a few fixed shapes. A graph and its buffers are kept
+        for every shape met, so this is not suited to varying shapes.
+    backend : str
+        One of "auto", "torchaudio" or "numba". "auto" uses numba when
+        use_cuda_graph is set, as this option only exists for numba, and
+        otherwise torchaudio when it can be imported.
 
     Example
     -------
     >>> import torch
     >>> loss = TransducerLoss(blank=0)
-    >>> logits = torch.randn((1,2,3,5)).cuda().requires_grad_()
-    >>> labels = torch.Tensor([[1,2]]).cuda().int()
-    >>> act_length = torch.Tensor([2]).cuda().int()
+    >>> logits = torch.randn((1,2,3,5)).requires_grad_()
+    >>> labels = torch.Tensor([[1,2]]).int()
+    >>> act_length = torch.Tensor([2]).int()
     >>> # U = label_length+1
-    >>> label_length = torch.Tensor([2]).cuda().int()
+    >>> label_length = torch.Tensor([2]).int()
     >>> l = loss(logits, labels, act_length, label_length)
     >>> l.backward()
     """
 
-    def __init__(self, blank=0, reduction="mean"):
+    def __init__(
+        self,
+        blank=0,
+        reduction="mean",
+        dtype=None,
+        fused_log_softmax=False,
+        use_cuda_graph=False,
+        backend="auto",
+    ):
         super().__init__()
+        if reduction not in REDUCTIONS:
+            raise ValueError(
+                f"Unexpected reduction {reduction}, expected one of {REDUCTIONS}"
+            )
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unexpected backend {backend}, expected one of {BACKENDS}"
+            )
         self.blank = blank
         self.reduction = reduction
+        self.dtype = dtype
+        self.fused_log_softmax = fused_log_softmax
+        self.use_cuda_graph = use_cuda_graph
         self.loss = Transducer.apply
-        try:
-            cuda.cuda_paths
-        except ImportError:
-            err_msg = "cannot import numba. To use Transducer loss\n"
-            err_msg += "=============================\n"
-            err_msg += "If you use your localhost:\n"
-            err_msg += "pip install numba\n"
-            err_msg += (
-                "export NUMBAPRO_LIBDEVICE='/usr/local/cuda/nvvm/libdevice/' \n"
+        # alpha and beta buffers and CUDA graphs reused across calls
+        self._workspace = {}
+        # rnnt_loss always fuses the log_softmax, only the CUDA graphs are
+        # specific to numba
+        if backend == "torchaudio" and use_cuda_graph:
+            raise ValueError(
+                "use_cuda_graph is only supported by the numba backend."
             )
-            err_msg += "export NUMBAPRO_NVVM='/usr/local/cuda/nvvm/lib64/libnvvm.so' \n"
-            err_msg += "================================ \n"
-            err_msg += "If you use conda:\n"
-            err_msg += "conda install numba cudatoolkit=XX (XX is your cuda toolkit version)"
-            raise ImportError(err_msg)
+        if backend == "auto" and use_cuda_graph:
+            backend = "numba"
+        self.backend = backend
+        if backend != "numba":
+            try:
+                from torchaudio.functional import rnnt_loss
+
+                self.rnnt_loss = rnnt_loss
+                self.backend = "torchaudio"
+            except ImportError:
+                if backend == "torchaudio":
+                    raise ImportError(
+                        "Cannot import torchaudio.functional.rnnt_loss, install torchaudio >= 0.10.0 or use backend='numba'."
+                    )
+                self.backend = "numba"
+        if self.backend == "numba":
+            # fails early if numba is missing
+            _get_kernels()
 
     def forward(self, logits, labels, T, U):
         """Computes the transducer loss."""
+        if self.backend == "torchaudio":
+            if self.dtype is not None:
+                logits = logits.to(self.dtype)
+            # rnnt_loss expects the padded sizes to match the longest
+            # lengths, the gradients of the cut padding are zeros
+            maxT = int(T.max())
+            maxU = int(U.max())
+            logits = logits[:, :maxT, : maxU + 1].contiguous()
+            labels = labels[:, :maxU].contiguous()
+            # rnnt_loss applies the log_softmax itself
+            costs = self.rnnt_loss(
+                logits,
+                labels.int(),
+                T.int(),
+                U.int(),
+                blank=self.blank,
+                reduction="none",
+            )
+            # normalize the loss over time, as the numba kernels do
+            costs = costs / T
+            if self.reduction == "mean":
+                return costs.mean()
+            elif self.reduction == "sum":
+                return costs.sum()
+            return costs
         # Transducer.apply function take log_probs tensor.
         if all(t.is_cuda for t in (logits, labels, T, U)):
-            log_probs = logits.log_softmax(-1)
+            if self.dtype is not None:
+                logits = logits.to(self.dtype)
+            if self.fused_log_softmax:
+                log_probs = logits
+            else:
+                log_probs = logits.log_softmax(-1)
             return self.loss(
-                log_probs, labels, T, U, self.blank, self.reduction
+                log_probs,
+                labels,
+                T,
+                U,
+                self.blank,
+                self.reduction,
+                self._workspace,
+                self.fused_log_softmax,
+                self.use_cuda_graph,
+                True,
             )
         else:
             raise ValueError(
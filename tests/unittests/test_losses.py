@@ -153,6 +153,294 @@ def test_transducer_loss(device):
     assert out_cost.item() == pytest.approx(2.2478, 0.0001)
 
 
+def test_transducer_loss_reduction():
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    with pytest.raises(ValueError):
+        TransducerLoss(blank=0, reduction="batchmean")
+
+
+def test_transducer_loss_backend():
+    pytest.importorskip("numba")
+    pytest.importorskip("torchaudio")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    assert TransducerLoss().backend == "torchaudio"
+    assert TransducerLoss(fused_log_softmax=True).backend == "torchaudio"
+    assert TransducerLoss(use_cuda_graph=True).backend == "numba"
+    with pytest.raises(ValueError):
+        TransducerLoss(use_cuda_graph=True, backend="torchaudio")
+
+
+def test_transducer_loss_torchaudio():
+    pytest.importorskip("torchaudio")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    logits = torch.Tensor(
+        [
+            [
+                [
+                    [0.1, 0.6, 0.1, 0.1, 0.1],
+                    [0.1, 0.1, 0.6, 0.1, 0.1],
+                    [0.1, 0.1, 0.2, 0.8, 0.1],
+                ],
+                [
+                    [0.1, 0.6, 0.1, 0.1, 0.1],
+                    [0.1, 0.1, 0.2, 0.1, 0.1],
+                    [0.7, 0.1, 0.2, 0.1, 0.1],
+                ],
+            ]
+        ]
+    ).requires_grad_()
+    labels = torch.Tensor([[1, 2]]).int()
+    act_length = torch.Tensor([2]).int()
+    label_length = torch.Tensor([2]).int()
+    loss = TransducerLoss(blank=0, backend="torchaudio")
+    out_cost = loss(logits, labels, act_length, label_length)
+    out_cost.backward()
+    # same value as the numba backend in test_transducer_loss
+    assert out_cost.item() == pytest.approx(2.2478, 0.0001)
+
+
+def test_transducer_loss_torchaudio_padding():
+    pytest.importorskip("torchaudio")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    torch.manual_seed(0)
+    logits = torch.randn(2, 6, 5, 7)
+    labels = torch.randint(1, 7, (2, 4), dtype=torch.int32)
+    T = torch.tensor([5, 4], dtype=torch.int32)
+    U = torch.tensor([2, 1], dtype=torch.int32)
+    loss = TransducerLoss(blank=0, reduction="none", backend="torchaudio")
+
+    # the time and label axes are padded past the longest lengths
+    x = logits.clone().requires_grad_()
+    costs = loss(x, labels, T, U)
+    costs.sum().backward()
+    y = logits[:, :5, :3].clone().requires_grad_()
+    ref_costs = loss(y, labels[:, :2], T, U)
+    ref_costs.sum().backward()
+    torch.testing.assert_close(costs, ref_costs)
+    torch.testing.assert_close(x.grad[:, :5, :3], y.grad)
+    assert x.grad[:, 5:].abs().sum() == 0
+    assert x.grad[:, :, 3:].abs().sum() == 0
+
+
+def test_transducer_skew():
+    from speechbrain.nnet.loss.transducer_loss import _skew
+
+    x = torch.arange(2 * 4 * 3).float().view(2, 4, 3)
+    skewed = _skew(x)
+    # each anti-diagonal t + u is a row, u stays the column
+    assert skewed.shape == (2, 4 + 3 - 1, 3)
+    for t in range(4):
+        for u in range(3):
+            assert torch.equal(skewed[:, t + u, u], x[:, t, u])
+
+
+def _rnnt_inputs():
+    device = torch.device("cuda")
+    torch.manual_seed(0)
+    logits = torch.randn(3, 6, 5, 7, device=device)
+    labels = torch.randint(1, 7, (3, 4), device=device, dtype=torch.int32)
+    T = torch.tensor([4, 6, 5], device=device, dtype=torch.int32)
+    U = torch.tensor([4, 2, 3], device=device, dtype=torch.int32)
+    return logits, labels, T, U
+
+
+def _rnnt_reference(logits, labels, T, U):
+    from torchaudio.functional import rnnt_loss
+
+    logits = logits.detach().float().requires_grad_()
+    costs = rnnt_loss(logits, labels, T, U, blank=0, reduction="none") / T
+    costs.sum().backward()
+    return costs.detach(), logits.grad
+
+
+def _check_rnnt_reference(loss, logits, labels, T, U, tol=1e-4):
+    ref_costs, ref_grads = _rnnt_reference(logits, labels, T, U)
+    if loss.reduction == "mean":
+        ref_costs = ref_costs.mean()
+        ref_grads = ref_grads / len(T)
+    elif loss.reduction == "sum":
+        ref_costs = ref_costs.sum()
+    x = logits.clone().requires_grad_()
+    costs = loss(x, labels, T, U)
+    costs.sum().backward()
+    torch.testing.assert_close(
+        costs.detach().float(), ref_costs, rtol=tol, atol=tol
+    )
+    torch.testing.assert_close(x.grad, ref_grads, rtol=tol, atol=tol)
+
+
+def test_transducer_loss_numba_reduction():
+    pytest.importorskip("numba")
+    pytest.importorskip("torchaudio")
+    if torch.cuda.device_count() == 0:
+        pytest.skip("This test can only be run if a GPU is available")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    # the costs are reduced by the last block of the kernel
+    logits, labels, T, U = _rnnt_inputs()
+    for reduction in ("mean", "sum", "none"):
+        loss = TransducerLoss(blank=0, reduction=reduction, backend="numba")
+        _check_rnnt_reference(loss, logits, labels, T, U)
+
+
+def test_transducer_loss_float16():
+    pytest.importorskip("numba")
+    pytest.importorskip("torchaudio")
+    if torch.cuda.device_count() == 0:
+        pytest.skip("This test can only be run if a GPU is available")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    logits, labels, T, U = _rnnt_inputs()
+    # the reference gets the same rounded logits, the kernels accumulate
+    # in float32
+    logits = logits.half().float()
+    loss = TransducerLoss(
+        blank=0, reduction="none", dtype=torch.float16, backend="numba"
+    )
+    _check_rnnt_reference(loss, logits, labels, T, U, tol=1e-2)
+
+
+def test_transducer_loss_padded_labels():
+    pytest.importorskip("numba")
+    pytest.importorskip("torchaudio")
+    if torch.cuda.device_count() == 0:
+        pytest.skip("This test can only be run if a GPU is available")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    logits, labels, T, U = _rnnt_inputs()
+    # the padding of the labels is never gathered, even when invalid
+    padding = torch.arange(labels.shape[1], device=labels.device) >= U[:, None]
+    loss = TransducerLoss(blank=0, reduction="none", backend="numba")
+    x = logits.clone().requires_grad_()
+    costs = loss(x, labels.masked_fill(padding, -1), T, U)
+    costs.sum().backward()
+    ref_costs, ref_grads = _rnnt_reference(logits, labels, T, U)
+    torch.testing.assert_close(costs.detach(), ref_costs)
+    torch.testing.assert_close(x.grad, ref_grads)
+
+
+def test_transducer_loss_unsorted_lengths():
+    pytest.importorskip("numba")
+    if torch.cuda.device_count() == 0:
+        pytest.skip("This test can only be run if a GPU is available")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    # the blocks run the utterances longest first, the results must still
+    # follow the order of the batch
+    logits, labels, T, U = _rnnt_inputs()
+    loss = TransducerLoss(blank=0, reduction="none", backend="numba")
+    x = logits.clone().requires_grad_()
+    costs = loss(x, labels, T, U)
+    costs.sum().backward()
+    perm = torch.tensor([2, 0, 1], device=T.device)
+    y = logits[perm].clone().requires_grad_()
+    perm_costs = loss(y, labels[perm], T[perm], U[perm])
+    perm_costs.sum().backward()
+    torch.testing.assert_close(perm_costs.detach(), costs.detach()[perm])
+    torch.testing.assert_close(y.grad, x.grad[perm])
+
+
+def test_transducer_loss_fused_log_softmax():
+    pytest.importorskip("numba")
+    pytest.importorskip("torchaudio")
+    if torch.cuda.device_count() == 0:
+        pytest.skip("This test can only be run if a GPU is available")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    logits, labels, T, U = _rnnt_inputs()
+    for reduction in ("mean", "sum", "none"):
+        loss = TransducerLoss(
+            blank=0,
+            reduction=reduction,
+            fused_log_softmax=True,
+            backend="numba",
+        )
+        _check_rnnt_reference(loss, logits, labels, T, U)
+
+
+def test_transducer_loss_narrow_labels():
+    pytest.importorskip("numba")
+    pytest.importorskip("torchaudio")
+    if torch.cuda.device_count() == 0:
+        pytest.skip("This test can only be run if a GPU is available")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    logits, labels, T, U = _rnnt_inputs()
+    ref_costs, ref_grads = _rnnt_reference(logits, labels, T, U)
+    # the label axis of the logits is padded past the columns of labels
+    padded = torch.nn.functional.pad(logits, (0, 0, 0, 2))
+    loss = TransducerLoss(blank=0, reduction="none", backend="numba")
+    x = padded.clone().requires_grad_()
+    costs = loss(x, labels, T, U)
+    costs.sum().backward()
+    torch.testing.assert_close(costs.detach(), ref_costs)
+    torch.testing.assert_close(x.grad[:, :, :5], ref_grads)
+    assert x.grad[:, :, 5:].abs().sum() == 0
+
+
+def test_transducer_apply_grad_scale():
+    pytest.importorskip("numba")
+    pytest.importorskip("torchaudio")
+    if torch.cuda.device_count() == 0:
+        pytest.skip("This test can only be run if a GPU is available")
+
+    from torchaudio.functional import rnnt_loss
+
+    from speechbrain.nnet.loss.transducer_loss import Transducer
+
+    logits, labels, T, U = _rnnt_inputs()
+    y = logits.clone().requires_grad_()
+    rnnt_loss(y, labels, T, U, blank=0, reduction="sum").backward()
+    # Transducer.apply keeps the gradients of the unnormalized costs,
+    # whatever the reduction
+    for reduction in ("mean", "sum", "none"):
+        x = logits.clone().requires_grad_()
+        cost = Transducer.apply(x.log_softmax(-1), labels, T, U, 0, reduction)
+        cost.sum().backward()
+        torch.testing.assert_close(x.grad, y.grad)
+
+
+def test_transducer_loss_cuda_graph():
+    pytest.importorskip("numba")
+    pytest.importorskip("torchaudio")
+    if torch.cuda.device_count() == 0:
+        pytest.skip("This test can only be run if a GPU is available")
+
+    from speechbrain.nnet.loss.transducer_loss import TransducerLoss
+
+    logits, labels, T, U = _rnnt_inputs()
+    ref_costs, ref_grads = _rnnt_reference(logits, labels, T, U)
+
+    for fused_log_softmax in (False, True):
+        loss = TransducerLoss(
+            blank=0,
+            reduction="none",
+            fused_log_softmax=fused_log_softmax,
+            backend="numba",
+            use_cuda_graph=True,
+        )
+        # the first call captures the graph, the second one replays it
+        for _ in range(2):
+            x = logits.clone().requires_grad_()
+            costs = loss(x, labels, T, U)
+            costs.sum().backward()
+            torch.testing.assert_close(costs.detach(), ref_costs)
+            torch.testing.assert_close(x.grad, ref_grads)
+
+
 def test_guided_attention_loss_mask(device):
     from speechbrain.nnet.loss.guidedattn_loss import GuidedAttentionLoss
 